@@ -1,6 +1,23 @@
-import json
 import os
+import sys
+import json
+import math
 import argparse
+from bisect import bisect_right
+import orjson
+
+RESULTS_DIR = "data/results"
+
+# Score kind -> (JSON key / file stem, label, script that produces it)
+SCORE_FILES = {
+    "retrieval": ("retrieval_score", "Retrieval", "src/eval_retrieval.py"),
+    "generation": ("generation_score", "Generation", "src/eval_generation.py"),
+    "ragas": ("ragas_score", "RAGAS", "src/eval_ragas.py"),
+}
+
+# Grade boundaries: rqi >= 0.9 -> A+, >= 0.8 -> A, ... below 0.5 -> F
+GRADE_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+GRADES = ["F", "D", "C", "B", "A", "A+"]
 
 def get_justification(retrieval, generation, ragas):
     justifications = []
@@ -29,30 +46,53 @@ def get_justification(retrieval, generation, ragas):
         
     return "\n".join(justifications)
 
-def aggregate_scores(save_name=None):
-    print("\n--- RAG Quality Index (RQI) Report ---\n")
-    
-    # 1. Load Scores
+def load_scores(out):
+    """
+    Reads every score file in RESULTS_DIR, defaulting missing ones to 0 and
+    appending a warning to `out`. One directory listing replaces a failed open() per missing file.
+    """
     try:
-        with open("data/results/retrieval_score.json", "r") as f:
-            retrieval = json.load(f).get("retrieval_score", 0)
+        with os.scandir(RESULTS_DIR) as it:
+            present = {entry.name for entry in it}
     except FileNotFoundError:
-        print("Warning: Retrieval score not found. Run src/eval_retrieval.py first.")
-        retrieval = 0
+        present = set()
 
-    try:
-        with open("data/results/generation_score.json", "r") as f:
-            generation = json.load(f).get("generation_score", 0)
-    except FileNotFoundError:
-        print("Warning: Generation score not found. Run src/eval_generation.py first.")
-        generation = 0
+    scores = {}
+    for kind, (key, label, script) in SCORE_FILES.items():
+        filename = f"{key}.json"
+        if filename in present:
+            with open(os.path.join(RESULTS_DIR, filename), "rb") as f:
+                raw = f.read()
+            try:
+                value = orjson.loads(raw).get(key, 0)
+            except orjson.JSONDecodeError:
+                # Files written by stdlib json may hold a bare NaN, which orjson rejects
+                value = json.loads(raw).get(key, 0)
+            # A NaN score (null in files written by orjson) means the metric could not be computed
+            if value is None or math.isnan(value):
+                out.append(f"Warning: {label} score is not a number. Treating it as 0.")
+                value = 0
+            scores[kind] = value
+        else:
+            out.append(f"Warning: {label} score not found. Run {script} first.")
+            scores[kind] = 0
+    return scores
 
-    try:
-        with open("data/results/ragas_score.json", "r") as f:
-            ragas = json.load(f).get("ragas_score", 0)
-    except FileNotFoundError:
-        print("Warning: RAGAS score not found. Run src/eval_ragas.py first.")
-        ragas = 0
+def get_grade(rqi):
+    # NaN compares false against every threshold, so bisect would place it above them all
+    if math.isnan(rqi):
+        return GRADES[0]
+    return GRADES[bisect_right(GRADE_THRESHOLDS, rqi)]
+
+def aggregate_scores(save_name=None):
+    # Collect the report and write it to stdout once at the end
+    out = ["\n--- RAG Quality Index (RQI) Report ---\n"]
+    
+    # 1. Load Scores
+    scores = load_scores(out)
+    retrieval = scores["retrieval"]
+    generation = scores["generation"]
+    ragas = scores["ragas"]
 
     # 2. Weights (Senior Engineer logic from README)
     W_RETRIEVAL = 0.4
@@ -61,29 +101,22 @@ def aggregate_scores(save_name=None):
 
     # 3. Calculate RQI
     rqi = (retrieval * W_RETRIEVAL) + (generation * W_GENERATION) + (ragas * W_RAGAS)
+    grade = get_grade(rqi)
 
-    # 4. Print Report
-    print(f"Retrieval Score (Recall):   {retrieval:.2f}  (Weight: {W_RETRIEVAL})")
-    print(f"Generation Score (Facts):   {generation:.2f}  (Weight: {W_GENERATION})")
-    print(f"RAGAS Score (Reasoning):    {ragas:.2f}  (Weight: {W_RAGAS})")
-    print("-" * 40)
-    
-    # Color code output if terminal supports it (simple logic)
-    grade = "F"
-    if rqi >= 0.9: grade = "A+"
-    elif rqi >= 0.8: grade = "A"
-    elif rqi >= 0.7: grade = "B"
-    elif rqi >= 0.6: grade = "C"
-    elif rqi >= 0.5: grade = "D"
-
-    print(f"Final RQI Score:            {rqi:.2f} / 1.00")
-    print(f"System Grade:               {grade}")
-    print("-" * 40)
-    
-    # 5. Detailed Justification
-    print("\n📝 SYSTEM JUSTIFICATION:")
-    print(get_justification(retrieval, generation, ragas))
-    print("-" * 40)
+    # 4. Report
+    out.extend([
+        f"Retrieval Score (Recall):   {retrieval:.2f}  (Weight: {W_RETRIEVAL})",
+        f"Generation Score (Facts):   {generation:.2f}  (Weight: {W_GENERATION})",
+        f"RAGAS Score (Reasoning):    {ragas:.2f}  (Weight: {W_RAGAS})",
+        "-" * 40,
+        f"Final RQI Score:            {rqi:.2f} / 1.00",
+        f"System Grade:               {grade}",
+        "-" * 40,
+        # 5. Detailed Justification
+        "\n📝 SYSTEM JUSTIFICATION:",
+        get_justification(retrieval, generation, ragas),
+        "-" * 40,
+    ])
 
     # 6. Save Report
     report_data = {
@@ -97,14 +130,20 @@ def aggregate_scores(save_name=None):
     
     if save_name:
         filename = f"data/results/report_{save_name}.json"
-        with open(filename, "w") as f:
-            json.dump(report_data, f, indent=4)
-        print(f"\n[INFO] Full report saved to: {filename}")
-        print("You can compare this with other models later.")
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(report_data, option=orjson.OPT_INDENT_2))
+        out.append(f"\n[INFO] Full report saved to: {filename}")
+        out.append("You can compare this with other models later.")
+
+    sys.stdout.write("\n".join(out) + "\n")
+    sys.stdout.flush()
+
+def main(save_name=None):
+    aggregate_scores(save_name)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--save_name", type=str, help="Name of the model/run to save results (e.g. 'groq_8b', 'gemini_flash')")
     args = parser.parse_args()
     
-    aggregate_scores(args.save_name)
+    main(args.save_name)
@@ -1,17 +1,58 @@
+import argparse
+import numpy as np
 import pandas as pd
 import os
 
-def create_dashboard(input_file, output_file):
+def _delta_frame(row_arr, row_baselines, is_self, version_idx, versions, metrics):
     """
-    Reads the flat valid Excel file and creates a multi-sheet dashboard.
+    Deltas of every row against the versions in version_idx, one column per
+    (version, metric), e.g. rqi_delta_vs_prompt_v0. Self-deltas (a row compared
+    with its own version, always 0) are left blank.
     """
-    print(f"Reading data from {input_file}...")
-    if not os.path.exists(input_file):
-        print(f"Error: Input file {input_file} not found.")
-        return
+    # (rows, metrics, 1) - (rows, metrics, len(version_idx)) in a single broadcast
+    delta = (row_arr[:, :, None] - row_baselines[:, :, version_idx]).round(4)
+    delta[np.broadcast_to(is_self[:, None, version_idx], delta.shape)] = np.nan
+
+    delta_cols = [f"{m}_delta_vs_{versions[v]}" for v in version_idx for m in metrics]
+    delta_values = delta.transpose(0, 2, 1).reshape(len(row_arr), len(delta_cols))
+    return pd.DataFrame(delta_values, columns=delta_cols)
+
+def create_dashboard(input_file, output_file, baseline=None, all_pairs=False):
+    """
+    Reads the flat valid Excel file (or its Parquet sibling) and creates a multi-sheet dashboard.
+    Delta_Analysis compares every row against the `baseline` prompt version (default: the
+    lexicographically first one); all_pairs=True adds an All_Pairs_Delta sheet against every version.
+    """
+    # Prefer the Parquet sibling written by export_results.py: it is much faster to
+    # parse than XLSX. Ignore it if the Excel file was re-exported more recently.
+    parquet_file = os.path.splitext(input_file)[0] + ".parquet"
+    use_parquet = os.path.exists(parquet_file) and (
+        not os.path.exists(input_file)
+        or os.path.getmtime(parquet_file) >= os.path.getmtime(input_file)
+    )
 
-    df = pd.read_excel(input_file)
+    if use_parquet:
+        print(f"Reading data from {parquet_file}...")
+        df = pd.read_parquet(parquet_file)
+    else:
+        print(f"Reading data from {input_file}...")
+        if not os.path.exists(input_file):
+            print(f"Error: Input file {input_file} not found.")
+            return
+
+        df = pd.read_excel(input_file)
+
+    # export_results stores scores as float32; widen them so the sheets show 0.8, not 0.800000011920929
+    float32_cols = df.select_dtypes("float32").columns
+    df[float32_cols] = df[float32_cols].astype("float64").round(6)
     
+    unique_versions = sorted(df["prompt_version"].dropna().unique())
+    if baseline is None and unique_versions:
+        baseline = unique_versions[0]
+    elif baseline not in unique_versions:
+        print(f"Error: Baseline '{baseline}' not found. Available: {unique_versions}")
+        return
+
     print(f"Creating dashboard at {output_file}...")
     
     # Ensure output directory exists
@@ -20,12 +61,17 @@ def create_dashboard(input_file, output_file):
         os.makedirs(output_dir)
 
     try:
-        # Check if xlsxwriter is installed, though pandas often defaults to 'openpyxl' if xlsxwriter isn't there.
-        # The user requested 'xlsxwriter' explicitly in the snippet, so we try to use it.
-        # If it fails, we can fallback or let it error (user likely has env capable if they provided snippet).
-        # We will wrap in try-except for import error if needed, but standard pandas usage is safer.
+        # xlsxwriter writes the workbook in a single pass and is much lighter than
+        # openpyxl's in-memory object tree; fall back to openpyxl if it is missing.
+        # Note: constant_memory mode is NOT used because pandas emits cells column
+        # by column, and constant_memory only keeps the current row.
+        try:
+            import xlsxwriter
+            excel_engine = "xlsxwriter"
+        except ImportError:
+            excel_engine = "openpyxl"
         
-        with pd.ExcelWriter(output_file) as writer:
+        with pd.ExcelWriter(output_file, engine=excel_engine) as writer:
 
             # =========================
             # Sheet 1: Raw Data
@@ -37,12 +83,15 @@ def create_dashboard(input_file, output_file):
             # =========================
             # Ensure numeric columns are actually numeric before groupby
             numeric_cols = ["rqi", "ragas", "retrieval", "generation"]
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            present_cols = [col for col in numeric_cols if col in df.columns]
+            df[present_cols] = df[present_cols].apply(pd.to_numeric, errors='coerce')
+            
+            # Cast versions to a categorical once so every groupby/pivot below
+            # works on integer codes instead of hashing strings
+            df["prompt_version"] = df["prompt_version"].astype(pd.CategoricalDtype(unique_versions))
             
             prompt_summary = (
-                df.groupby("prompt_version")[numeric_cols]
+                df.groupby("prompt_version", sort=False, observed=True)[numeric_cols]
                 .mean()
                 .reset_index()
                 .round(4)
@@ -62,7 +111,8 @@ def create_dashboard(input_file, output_file):
                     index="question_text",
                     columns="prompt_version",
                     values="rqi",
-                    aggfunc="mean"
+                    aggfunc="mean",
+                    observed=True
                 )
                 .reset_index()
                 .round(4)
@@ -77,56 +127,49 @@ def create_dashboard(input_file, output_file):
             # =========================
             # Sheet 4: Delta Analysis
             # =========================
-            # Calculate deltas against ALL unique prompt versions found
-            unique_versions = sorted(df["prompt_version"].unique())
-            
-            # Start with the base dataframe
-            deltas_df = df.copy()
+            # Calculate deltas against the baseline version (and optionally all versions)
             
             # List of metrics to calculate deltas for
             metrics = ["rqi", "ragas"]
             
-            # Keep track of delta columns to add them to output key columns
-            delta_cols = []
-
-            for base_ver in unique_versions:
-                # Prepare the baseline data for this version
-                # We filter for the specific version and select relevant columns
-                baseline_subset = df[df["prompt_version"] == base_ver][["question_text"] + metrics].copy()
-                
-                # Rename columns to differentiate (e.g., rqi -> rqi_v0)
-                suffix = f"_{base_ver}"
-                rename_map = {m: f"{m}{suffix}" for m in metrics}
-                baseline_subset = baseline_subset.rename(columns=rename_map)
-                
-                # Merge this specific baseline back to the main df on question_text
-                # Note: This repeats the baseline values for every row with the same question
-                deltas_df = deltas_df.merge(baseline_subset, on="question_text", how="left")
-                
-                # Calculate deltas for each metric
-                for m in metrics:
-                    base_col = f"{m}{suffix}"
-                    delta_col_name = f"{m}_delta_vs_{base_ver}"
-                    
-                    if base_col in deltas_df.columns:
-                        deltas_df[delta_col_name] = (deltas_df[m] - deltas_df[base_col]).round(4)
-                        delta_cols.append(delta_col_name)
+            # One pivot gives every version's value per question; reindex to the full
+            # (metric, version) grid so it reshapes to (questions, metrics, versions)
+            version_pivot = df.pivot_table(
+                index="question_text",
+                columns="prompt_version",
+                values=metrics,
+                aggfunc="mean",
+                observed=True
+            ).reindex(columns=pd.MultiIndex.from_product([metrics, unique_versions]))
+            pivot_arr = version_pivot.to_numpy(dtype="float64").reshape(
+                len(version_pivot), len(metrics), len(unique_versions)
+            )
+            
+            # Gather each row's per-question values for every version
+            q_idx = version_pivot.index.get_indexer(df["question_text"])
+            row_baselines = pivot_arr[q_idx]
+            row_baselines[q_idx < 0] = np.nan # Rows whose question is missing from the pivot
+            row_arr = df[metrics].to_numpy(dtype="float64")
             
-            # Select final columns: Identities + Metrics + All Deltas
-            # We want to keep the original structure but append all the verified delta columns
+            # is_self[r, v]: row r belongs to version v (categorical codes follow unique_versions)
+            row_ver_idx = df["prompt_version"].cat.codes.to_numpy()
+            is_self = np.arange(len(unique_versions))[None, :] == row_ver_idx[:, None]
             
+            # Select final columns: Identities + Metrics + Deltas
             basic_cols = [
                 "question_id", "question_text", "prompt_version", 
                 "grade", "rqi", "ragas", "retrieval", "generation", "model_name"
             ]
             
             # Filter basic_cols to what actually exists
-            final_cols = [c for c in basic_cols if c in deltas_df.columns]
+            final_cols = [c for c in basic_cols if c in df.columns]
+            id_df = df[final_cols].reset_index(drop=True)
             
-            # Add the dynamically generated delta columns
-            final_cols.extend(delta_cols)
-            
-            deltas_df = deltas_df[final_cols]
+            base_idx = unique_versions.index(baseline)
+            deltas_df = pd.concat([
+                id_df,
+                _delta_frame(row_arr, row_baselines, is_self, [base_idx], unique_versions, metrics)
+            ], axis=1)
 
             deltas_df.to_excel(
                 writer,
@@ -134,14 +177,34 @@ def create_dashboard(input_file, output_file):
                 index=False
             )
 
+            # =========================
+            # Sheet 5 (optional): All-Pairs Delta
+            # =========================
+            if all_pairs:
+                all_pairs_df = pd.concat([
+                    id_df,
+                    _delta_frame(row_arr, row_baselines, is_self, list(range(len(unique_versions))), unique_versions, metrics)
+                ], axis=1)
+
+                all_pairs_df.to_excel(
+                    writer,
+                    sheet_name="All_Pairs_Delta",
+                    index=False
+                )
+
         print("✅ impact_analysis_dashboard.xlsx created")
         
     except Exception as e:
         print(f"Error creating dashboard: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the prompt impact Excel dashboard.")
+    parser.add_argument("--baseline", type=str, default=None, help="Prompt version to compute deltas against (default: lexicographically first, e.g. 'prompt_v0')")
+    parser.add_argument("--all_pairs", action="store_true", help="Also write an All_Pairs_Delta sheet with deltas against every version")
+    args = parser.parse_args()
+
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     input_xlsx_path = os.path.join(base_dir, "data", "prompt_versions", "impact_analysis.xlsx")
     output_dashboard_path = os.path.join(base_dir, "data", "prompt_versions", "impact_analysis_dashboard.xlsx")
     
-    create_dashboard(input_xlsx_path, output_dashboard_path)
+    create_dashboard(input_xlsx_path, output_dashboard_path, baseline=args.baseline, all_pairs=args.all_pairs)
@@ -8,11 +8,18 @@ from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
 import faiss
+from functools import lru_cache
 
 # Import embedding classes
 # Moved inside function to allow optional dependencies
 
+@lru_cache(maxsize=8)
 def get_embeddings(provider):
+    """
+    Returns the embedding model for the given provider, cached per provider so the
+    offline model weights are only loaded once per process.
+    Call get_embeddings.cache_clear() after changing API keys in the environment.
+    """
     load_dotenv()
     if provider == "openai":
         try:
@@ -1,11 +1,17 @@
-import json
+import orjson
 import os
 import argparse
 import numpy as np
-from rag_pipeline import rag 
+from dotenv import load_dotenv
+try:
+    from src.rag_pipeline import rag_batch, run_async
+    from src.shared_data import load_test_data
+except ImportError:
+    from rag_pipeline import rag_batch, run_async
+    from shared_data import load_test_data
 # uses get_embeddings and get_llm internally via rag_pipeline
 
-def evaluate_generation(test_file, index_dir, provider="offline", llm_provider="openai"):
+def evaluate_generation(test_file, index_dir, provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0"):
     """
     Evaluates generation by checking if expected keywords are present in the LLM's answer.
     """
@@ -13,23 +19,27 @@ def evaluate_generation(test_file, index_dir, provider="offline", llm_provider="
         print(f"Test file not found: {test_file}")
         return
 
-    # Load test queries
-    with open(test_file, 'r') as f:
-        test_data = json.load(f)
+    # Load test queries (from run_eval's shared memory when it provides them)
+    test_data = load_test_data(test_file)
+    
+    items = [item for item in test_data if item.get("query")]
     
     scores = []
-    import time
-    print(f"Running generation evaluation on {len(test_data)} queries...")
+    print(f"Running generation evaluation on {len(items)} queries...")
+
+    # Run RAG for all queries concurrently (bounded by RAG_CONCURRENCY)
+    results = run_async(rag_batch(
+        [item["query"] for item in items],
+        index_dir=index_dir,
+        embedding_provider=provider,
+        llm_provider=llm_provider,
+        system_prompt=system_prompt,
+        prompt_version=prompt_version
+    ))
 
-    for item in test_data:
-        query = item.get("query")
+    for item, result in zip(items, results):
+        query = item["query"]
         expected_keywords = item.get("expected_keywords", [])
-        
-        if not query:
-            continue
-            
-        # Run RAG
-        result = rag(query, index_dir=index_dir, embedding_provider=provider, llm_provider=llm_provider)
         answer = result.get("answer", "")
         
         # Calculate generation score (Recall of keywords)
@@ -44,18 +54,26 @@ def evaluate_generation(test_file, index_dir, provider="offline", llm_provider="
         print(f"Query: {query}")
         print(f"Answer: {answer}")
         print(f"Score: {score:.2f}\n")
-        time.sleep(10) # Heavy sleep to avoid RPM limits
 
     avg_score = np.mean(scores) if scores else 0
     print(f"Average Generation Score: {avg_score:.2f}")
 
     # Save score for aggregation
     os.makedirs("data/results", exist_ok=True)
-    with open("data/results/generation_score.json", "w") as f:
-        json.dump({"generation_score": avg_score}, f)
+    # orjson writes a NaN score as null, which aggregate_scores treats as missing
+    with open("data/results/generation_score.json", "wb") as f:
+        f.write(orjson.dumps({"generation_score": float(avg_score)}))
 
     return avg_score
 
+def main(test_file="data/test_generation.json", index_dir="data/faiss_index", provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0"):
+    """
+    system_prompt/prompt_version override the RAG_SYSTEM_PROMPT/RAG_PROMPT_VERSION env vars.
+    """
+    load_dotenv()
+
+    return evaluate_generation(test_file, index_dir, provider=provider, llm_provider=llm_provider, system_prompt=system_prompt, prompt_version=prompt_version)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--test_file", default="data/test_generation.json")
@@ -64,4 +82,4 @@ if __name__ == "__main__":
     parser.add_argument("--llm_provider", default="openai", help="LLM provider (openai, vertex, grok, gemini)")
     args = parser.parse_args()
 
-    evaluate_generation(args.test_file, args.index_dir, provider=args.provider, llm_provider=args.llm_provider)
+    main(args.test_file, args.index_dir, provider=args.provider, llm_provider=args.llm_provider)
@@ -1,9 +1,10 @@
-import json
+import orjson
 import os
 import argparse
 import pandas as pd
 from datasets import Dataset 
 from ragas import evaluate
+from ragas.run_config import RunConfig
 from ragas.metrics import (
     ContextPrecision,
     ContextRecall,
@@ -16,9 +17,17 @@ context_precision = ContextPrecision()
 context_recall = ContextRecall()
 answer_relevance = ResponseRelevancy()
 faithfulness = Faithfulness()
-from rag_pipeline import rag
+from dotenv import load_dotenv
+try:
+    from src.rag_pipeline import rag_batch, run_async, get_judge_llm, MAX_RETRIES, MAX_BACKOFF
+    from src.embed_store import get_embeddings
+    from src.shared_data import load_test_data
+except ImportError:
+    from rag_pipeline import rag_batch, run_async, get_judge_llm, MAX_RETRIES, MAX_BACKOFF
+    from embed_store import get_embeddings
+    from shared_data import load_test_data
 
-def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="openai"):
+def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0"):
     """
     Runs comprehensive RAG evaluation using RAGAS.
     """
@@ -26,8 +35,8 @@ def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="opena
         print(f"Test file not found: {test_file}")
         return
 
-    with open(test_file, 'r') as f:
-        test_data = json.load(f)
+    # Load test queries (from run_eval's shared memory when it provides them)
+    test_data = load_test_data(test_file)
 
     # Prepare data for RAGAS
     # RAGAS expects: question, answer, contexts, ground_truths
@@ -37,17 +46,23 @@ def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="opena
     contexts = []
     ground_truths = []
 
-    print(f"Running RAG pipeline for {len(test_data)} queries...")
+    items = [item for item in test_data if item.get("query")]
+    print(f"Running RAG pipeline for {len(items)} queries...")
+    
+    # Run RAG for all queries concurrently (bounded by RAG_CONCURRENCY)
+    results = run_async(rag_batch(
+        [item["query"] for item in items],
+        index_dir=index_dir,
+        embedding_provider=provider,
+        llm_provider=llm_provider,
+        system_prompt=system_prompt,
+        prompt_version=prompt_version
+    ))
     
-    for item in test_data:
-        query = item.get("query")
+    for item, result in zip(items, results):
+        query = item["query"]
         ground_truth = item.get("ground_truth") # RAGAS typically needs ground truth for recall
         
-        if not query:
-            continue
-            
-        result = rag(query, index_dir=index_dir, embedding_provider=provider, llm_provider=llm_provider)
-        
         questions.append(query)
         answers.append(result["answer"])
         contexts.append(result["retrieved_chunks"])
@@ -56,8 +71,6 @@ def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="opena
         print(f"Questions: {query}")
         print(f"Generated: {result['answer']}")
         print(f"Ground Truth: {ground_truth}\n")
-        import time
-        time.sleep(10) # Avoid RPM limit
 
     # Create HF Dataset
     data = {
@@ -71,11 +84,8 @@ def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="opena
     print("Running RAGAS evaluation...")
     
     # Configure RAGAS with the same LLM/Embeddings as the pipeline
-    from rag_pipeline import get_llm
-    from embed_store import get_embeddings
-    
     # Ragas expects LangChain objects
-    eval_llm = get_llm(llm_provider)
+    eval_llm = get_judge_llm(llm_provider)
     eval_embeddings = get_embeddings(provider)
 
     results = evaluate(
@@ -87,7 +97,13 @@ def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="opena
             answer_relevance,
         ],
         llm=eval_llm, 
-        embeddings=eval_embeddings
+        embeddings=eval_embeddings,
+        # Judge calls are paced by eval_llm's rate limiter; retry them on the pipeline's policy
+        run_config=RunConfig(
+            max_retries=MAX_RETRIES,
+            max_wait=MAX_BACKOFF,
+            max_workers=int(os.getenv("RAG_CONCURRENCY", "8"))
+        )
     )
     
     print("\nRAGAS Results:")
@@ -121,8 +137,18 @@ def evaluate_ragas(test_file, index_dir, provider="offline", llm_provider="opena
 
     # Save score for aggregation
     os.makedirs("data/results", exist_ok=True)
-    with open("data/results/ragas_score.json", "w") as f:
-        json.dump({"ragas_score": avg_score if 'avg_score' in locals() else avg_ragas_score}, f)
+    # orjson writes a NaN score as null, which aggregate_scores treats as missing
+    with open("data/results/ragas_score.json", "wb") as f:
+        f.write(orjson.dumps({"ragas_score": float(avg_score if 'avg_score' in locals() else avg_ragas_score)}))
+
+def main(test_file="data/test_ragas.json", index_dir="data/faiss_index", provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0"):
+    """
+    system_prompt/prompt_version override the RAG_SYSTEM_PROMPT/RAG_PROMPT_VERSION env vars.
+    """
+    # Check .env
+    load_dotenv()
+    
+    evaluate_ragas(test_file, index_dir, provider=provider, llm_provider=llm_provider, system_prompt=system_prompt, prompt_version=prompt_version)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -132,8 +158,4 @@ if __name__ == "__main__":
     parser.add_argument("--llm_provider", default="openai") # openai, vertex, grok, gemini
     args = parser.parse_args()
 
-    # Check .env
-    from dotenv import load_dotenv
-    load_dotenv()
-    
-    evaluate_ragas(args.test_file, args.index_dir, provider=args.provider, llm_provider=args.llm_provider)
+    main(args.test_file, args.index_dir, provider=args.provider, llm_provider=args.llm_provider)
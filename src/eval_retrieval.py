@@ -1,9 +1,14 @@
-import json
+import orjson
 import os
 import argparse
 import numpy as np
-from embed_store import get_embeddings
-from langchain_community.vectorstores import FAISS
+from dotenv import load_dotenv
+try:
+    from src.rag_pipeline import load_vectorstore
+    from src.shared_data import load_test_data
+except ImportError:
+    from rag_pipeline import load_vectorstore
+    from shared_data import load_test_data
 
 def evaluate_retrieval(test_file, index_dir, top_k=3, provider="offline"):
     """
@@ -13,14 +18,12 @@ def evaluate_retrieval(test_file, index_dir, top_k=3, provider="offline"):
         print(f"Test file not found: {test_file}")
         return
 
-    # Load test queries
-    with open(test_file, 'r') as f:
-        test_data = json.load(f)
+    # Load test queries (from run_eval's shared memory when it provides them)
+    test_data = load_test_data(test_file)
 
-    # Load FAISS
+    # Load FAISS (shared with rag_pipeline's cache when run in-process)
     try:
-        embedding_model = get_embeddings(provider)
-        vectorstore = FAISS.load_local(index_dir, embedding_model, allow_dangerous_deserialization=True)
+        vectorstore = load_vectorstore(provider, index_dir)
     except Exception as e:
         print(f"Error loading index: {e}")
         return
@@ -60,20 +63,23 @@ def evaluate_retrieval(test_file, index_dir, top_k=3, provider="offline"):
 
     # Save score for aggregation
     os.makedirs("data/results", exist_ok=True)
-    with open("data/results/retrieval_score.json", "w") as f:
-        json.dump({"retrieval_score": avg_score}, f)
+    # orjson writes a NaN score as null, which aggregate_scores treats as missing
+    with open("data/results/retrieval_score.json", "wb") as f:
+        f.write(orjson.dumps({"retrieval_score": float(avg_score)}))
         
     return avg_score
 
+def main(test_file="data/test_retrieval.json", index_dir="data/faiss_index", provider="offline"):
+    # Check .env if needed
+    load_dotenv()
+
+    return evaluate_retrieval(test_file, index_dir, top_k=3, provider=provider)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--test_file", default="data/test_retrieval.json")
     parser.add_argument("--index_dir", default="data/faiss_index")
     parser.add_argument("--provider", default="offline")
     args = parser.parse_args()
-    
-    # Check .env if needed
-    from dotenv import load_dotenv
-    load_dotenv()
 
-    evaluate_retrieval(args.test_file, args.index_dir, top_k=3, provider=args.provider)
+    main(args.test_file, args.index_dir, provider=args.provider)
@@ -1,28 +1,49 @@
-import json
+import orjson
 import pandas as pd
 import os
 
+# Flat schema of the exported table; row tuples are built in this order
+COLUMNS = [
+    "question_id", "question_text", "prompt_version",
+    "grade", "rqi", "ragas", "retrieval", "generation", "model_name"
+]
+NUMERIC_COLS = ["rqi", "ragas", "retrieval", "generation"]
+
+# Scores are 0..1 so float32 is plenty; low-cardinality labels become categoricals
+DTYPES = {
+    **{col: "float32" for col in NUMERIC_COLS},
+    "prompt_version": "category",
+    "grade": "category",
+    "model_name": "category"
+}
+
 def export_impact_analysis(input_file, output_file):
     """
     Reads the nested impact analysis JSON and exports it to a flat Excel file.
     
     Args:
         input_file (str): Path to the input JSON file.
-        output_file (str): Path to the output Excel file.
+        output_file (str): Path to the output Excel file. A .parquet sibling is also written.
     """
     print(f"Reading data from {input_file}...")
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(input_file, 'rb') as f:
+            data = orjson.loads(f.read())
     except FileNotFoundError:
         print(f"Error: Input file not found at {input_file}")
         return
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         print(f"Error: Failed to decode JSON from {input_file}")
         return
 
-    rows = []
+    # Per-version scores are stored once under "_meta"; older files keep them on each entry
+    meta_scores = data.pop("_meta", {}).get("scores", {})
+
+    # Preallocate one slot per (question, prompt_version) record
+    total = sum(len(qdata.get("prompt_results", {})) for qdata in data.values())
+    rows = [None] * total
+    i = 0
 
     # Iterate through questions
     for question_text, qdata in data.items():
@@ -41,40 +62,32 @@ def export_impact_analysis(input_file, output_file):
         prompt_results = qdata.get("prompt_results", {})
         
         for prompt_version, pdata in prompt_results.items():
-            scores = pdata.get("scores", {})
+            scores = meta_scores.get(prompt_version) or pdata.get("scores", {})
             
             # Extract scores with safe defaults (None for missing)
-            # Ensure we look for the specific keys requested
-            grade = scores.get("grade")
-            rqi = scores.get("rqi")
-            ragas_score = scores.get("ragas")
-            retrieval_score = scores.get("retrieval")
-            generation_score = scores.get("generation")
-            model_name = scores.get("model_name")
-            
-            row = {
-                "question_id": question_id,
-                "question_text": actual_question_text,
-                "prompt_version": prompt_version,
-                "grade": grade,
-                "rqi": rqi,
-                "ragas": ragas_score,
-                "retrieval": retrieval_score,
-                "generation": generation_score,
-                "model_name": model_name
-            }
-            rows.append(row)
+            # Tuple order must match COLUMNS
+            rows[i] = (
+                question_id,
+                actual_question_text,
+                prompt_version,
+                scores.get("grade"),
+                scores.get("rqi"),
+                scores.get("ragas"),
+                scores.get("retrieval"),
+                scores.get("generation"),
+                scores.get("model_name")
+            )
+            i += 1
 
     if not rows:
         print("No data found to export.")
         return
 
-    df = pd.DataFrame(rows)
+    df = pd.DataFrame.from_records(rows, columns=COLUMNS)
 
-    # Explicitly ensure numeric types for score columns
-    numeric_cols = ["rqi", "ragas", "retrieval", "generation"]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+    # Explicitly ensure numeric types for score columns, then apply the compact dtypes
+    df[NUMERIC_COLS] = df[NUMERIC_COLS].apply(pd.to_numeric, errors='coerce')
+    df = df.astype(DTYPES)
 
     print(f"Data flattened. Found {len(df)} rows.")
     print(f"Exporting to {output_file}...")
@@ -85,11 +98,22 @@ def export_impact_analysis(input_file, output_file):
         os.makedirs(output_dir)
 
     try:
-        df.to_excel(output_file, index=False)
+        # Widen scores back to float64 for Excel so cells read 0.8, not 0.800000011920929
+        excel_df = df.astype({col: "float64" for col in NUMERIC_COLS}).round(6)
+        excel_df.to_excel(output_file, index=False)
         print("Export successful! ✅")
     except Exception as e:
         print(f"Error writing to Excel file: {e}")
 
+    # Columnar sibling for fast re-reads by create_dashboard.py;
+    # the Excel file stays the human-readable output
+    parquet_file = os.path.splitext(output_file)[0] + ".parquet"
+    try:
+        df.to_parquet(parquet_file, engine="pyarrow", compression="zstd", index=False)
+        print(f"Parquet copy written to {parquet_file}")
+    except Exception as e:
+        print(f"Warning: Could not write Parquet file ({e}). Dashboard will read the Excel file instead.")
+
 if __name__ == "__main__":
     # Define paths relative to the project root or use absolute paths
     # Assuming script is run from project root, but let's be robust
@@ -1,10 +1,20 @@
 import os
+import time
+import asyncio
+import hashlib
+import threading
+import contextvars
+from functools import lru_cache
+import faiss
+import numpy as np
 from dotenv import load_dotenv
 from langchain_community.vectorstores import FAISS
 # LCEL Imports
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
+from langchain_core.runnables import RunnablePassthrough, RunnableParallel, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.rate_limiters import BaseRateLimiter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 # LLMs
 # Moved inside function
 try:
@@ -12,9 +22,38 @@ try:
 except ImportError:
     from embed_store import get_embeddings
 
+# .env is read once at import. The LLM and embedding clients are cached with the keys
+# they were built with, so re-reading it per call would not pick up new keys anyway
+# (call get_llm.cache_clear() / get_embeddings.cache_clear() after changing them).
 load_dotenv()
 
-def get_llm(provider):
+# OpenAI-compatible clients get their own httpx clients instead of the default ones,
+# which langchain-openai shares process-wide: every get_llm() instance then owns its
+# pools, and the RAGAS judge (see get_judge_llm) never reuses a socket opened on the
+# run_async() loop. Limits match the openai SDK's defaults.
+HTTP_MAX_CONNECTIONS = 1000
+HTTP_MAX_KEEPALIVE = 100
+
+def _http_clients(keepalive=True):
+    """
+    Sync and async httpx clients for a ChatOpenAI instance. With keepalive=False,
+    connections are closed after each response, so the clients hold no open sockets.
+    """
+    import httpx # installed with openai
+    limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE if keepalive else 0)
+    return {"http_client": httpx.Client(limits=limits), "http_async_client": httpx.AsyncClient(limits=limits)}
+
+@lru_cache(maxsize=8)
+def get_llm(provider, keepalive=True):
+    """
+    Returns a chat model client for the given provider.
+    Clients are cached per provider so repeated rag() calls share one HTTP session;
+    the key check below (and its debug line) therefore only runs on first use.
+    API keys are read at construction time: call get_llm.cache_clear() after
+    changing them in the environment. Chat models carry the provider's shared
+    rate limiter (see get_rate_limiter), so every call through them is paced.
+    keepalive=False turns off connection reuse for OpenAI-compatible clients.
+    """
     if provider == "openai":
         try:
              from langchain_openai import ChatOpenAI
@@ -24,7 +63,7 @@ def get_llm(provider):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found")
-        return ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=api_key, temperature=0)
+        return ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=api_key, temperature=0, rate_limiter=get_rate_limiter(provider), **_http_clients(keepalive))
     elif provider == "vertex":
         try:
             from langchain_google_vertexai import VertexAI
@@ -49,7 +88,9 @@ def get_llm(provider):
             model="grok-beta", 
             openai_api_key=api_key, 
             openai_api_base="https://api.x.ai/v1",
-            temperature=0
+            temperature=0,
+            rate_limiter=get_rate_limiter(provider),
+            **_http_clients(keepalive)
         )
     elif provider == "gemini":
         try:
@@ -61,7 +102,7 @@ def get_llm(provider):
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found in .env")
             
-        return ChatGoogleGenerativeAI(model="gemini-flash-latest", google_api_key=api_key, temperature=0)
+        return ChatGoogleGenerativeAI(model="gemini-flash-latest", google_api_key=api_key, temperature=0, rate_limiter=get_rate_limiter(provider))
 
     elif provider == "groq":
         try:
@@ -75,66 +116,179 @@ def get_llm(provider):
             
         print(f"[DEBUG] Using GROQ_API_KEY ending in: ...{api_key[-4:]}")
         
-        return ChatGroq(model_name="llama-3.3-70b-versatile", groq_api_key=api_key, temperature=0)
+        return ChatGroq(model_name="llama-3.3-70b-versatile", groq_api_key=api_key, temperature=0, rate_limiter=get_rate_limiter(provider))
 
     else:
         raise ValueError(f"Unknown LLM provider: {provider}")
 
-def rag(query, index_dir="data/faiss_index", top_k=3, embedding_provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0"):
+# Retry policy for provider rate limits (429 / quota errors)
+MAX_RETRIES = 5
+MAX_BACKOFF = 60 # seconds
+
+def is_rate_limit_error(e):
+    error_msg = str(e)
+    return "429" in error_msg or "Rate limit" in error_msg or "quota" in error_msg.lower()
+
+def _retry_after_seconds(e):
     """
-    End-to-end RAG function using LCEL. 
-    Returns a dictionary with query, answer, and retrieved documents.
+    Returns the server's Retry-After hint (in seconds) from the provider's HTTP
+    response, if the exception carries one. Groq, OpenAI and Gemini all set it on 429s.
     """
-    
-    # 1. Load Embeddings & Index
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
     try:
-        embedding_model = get_embeddings(embedding_provider)
-        vectorstore = FAISS.load_local(index_dir, embedding_model, allow_dangerous_deserialization=True)
-    except Exception as e:
-        return {"error": f"Failed to load index/embeddings: {e}"}
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        # Missing, or given as an HTTP date
+        return None
 
-    # 2. Setup Retriever
-    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
+_exponential_backoff = wait_exponential_jitter(initial=1, max=MAX_BACKOFF)
 
-    # 3. Setup LLM
-    try:
-        llm = get_llm(llm_provider)
-    except Exception as e:
-        return {"error": f"Failed to initialize LLM: {e}"}
+def _rate_limit_wait(retry_state):
+    # Honor the server's hint when present, otherwise exponential backoff + jitter (1s, 2s, 4s...)
+    retry_after = _retry_after_seconds(retry_state.outcome.exception())
+    if retry_after is not None:
+        return min(retry_after, MAX_BACKOFF)
+    return _exponential_backoff(retry_state)
 
-    # 4. Define Prompt
-    template = """Use the following pieces of context to answer the question at the end. 
-    If you don't know the answer, just say that you don't know, don't try to make up an answer. 
-    Use three sentences maximum and keep the answer concise.
+def _log_rate_limit(retry_state):
+    error_msg = str(retry_state.outcome.exception())
+    print(f"\n[WARNING] Rate limit hit. Sleeping {retry_state.next_action.sleep:.1f}s before retry {retry_state.attempt_number}/{MAX_RETRIES}...")
+    print(f"Error details: {error_msg[:200]}...") # Print snippet only
 
-    Context: {context}
+# Non rate-limit errors are raised immediately; the last rate-limit error is re-raised
+# once MAX_RETRIES attempts are exhausted.
+rate_limit_retry = retry(
+    retry=retry_if_exception(is_rate_limit_error),
+    wait=_rate_limit_wait,
+    stop=stop_after_attempt(MAX_RETRIES),
+    before_sleep=_log_rate_limit,
+    reraise=True
+)
 
-    Question: {question}
+# Requests per minute allowed by each provider's default tier.
+# RAG_RATE_LIMIT_RPM overrides the value for whichever provider is in use.
+RATE_LIMITS = {"openai": 500, "groq": 30, "gemini": 60, "grok": 50}
 
-    Helpful Answer:"""
-    custom_rag_prompt = PromptTemplate.from_template(template)
+class RateLimiter(BaseRateLimiter):
+    """
+    Spaces requests 60/rpm seconds apart, so no minute ever sees more than rpm of them
+    (a bucket that starts full would let a further rpm through in its first minute).
+    It is thread-safe and not tied to an event loop, so the eval stages' threads and their
+    event loops share one limiter per provider. get_llm attaches it to the chat model, so
+    every model call is paced: RAG answers, change summaries, RAGAS judging and retries.
+    """
 
-    # Load environment variables with override to pick up new keys
-    load_dotenv(override=True)
-    
-    # 3. Setup RAG Chain
-    # ... (rest of the setup code remains similar, but we need to ensure local variables are refreshed)
-    
-    # Re-initialize LLM and Embeddings to ensure fresh API keys are used if env changed
-    # (Checking if it's cheap to re-init. It is.)
-    try:
-        llm = get_llm(llm_provider)
-    except Exception as e:
-        return {"error": f"Failed to initialize LLM: {e}"}
-    
-    try:
-        embeddings = get_embeddings(embedding_provider)
-        vectorstore = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
-    except Exception as e:
-        return {"error": f"Failed to load index/embeddings: {e}"}
-    
-    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
-    
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, blocking):
+        # Claims the next free slot and returns how long to wait for it (None if not blocking and busy)
+        with self._lock:
+            now = time.monotonic()
+            if not blocking and self._next_slot > now:
+                return None
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    def acquire(self, *, blocking=True):
+        delay = self._reserve(blocking)
+        if delay is None:
+            return False
+        if delay:
+            time.sleep(delay)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        delay = self._reserve(blocking)
+        if delay is None:
+            return False
+        if delay:
+            await asyncio.sleep(delay)
+        return True
+
+@lru_cache(maxsize=8)
+def get_rate_limiter(provider):
+    """Returns the process-wide limiter for provider, or None if it has no known limit."""
+    rpm = os.getenv("RAG_RATE_LIMIT_RPM") or RATE_LIMITS.get(provider)
+    return RateLimiter(float(rpm)) if rpm else None
+
+# Pacing happens in the model's rate limiter, so each retried attempt also waits its turn
+@rate_limit_retry
+def _invoke_with_retry(chain, query):
+    return chain.invoke(query)
+
+@rate_limit_retry
+async def _ainvoke_with_retry(chain, query):
+    return await chain.ainvoke(query)
+
+# One long-lived event loop for every coroutine that uses the cached clients. The async
+# connection pools inside them (httpx, grpc) are tied to one loop and are not thread-safe,
+# so per-call asyncio.run() loops in parallel stage threads must not share them.
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+def _get_async_loop():
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, name="rag-async-loop", daemon=True).start()
+    return _async_loop
+
+def run_async(coro):
+    """
+    Runs coro on the process-wide event loop and blocks until it returns; use it instead
+    of asyncio.run(). Safe to call from several threads at once: their coroutines
+    interleave on the same loop. The caller's context variables are carried over.
+    """
+    ctx = contextvars.copy_context()
+
+    async def in_caller_context():
+        for var, value in ctx.items():
+            var.set(value)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(in_caller_context(), _get_async_loop()).result()
+
+def get_judge_llm(provider):
+    """
+    A fresh, uncached chat model for RAGAS. RAGAS drives its judge calls from its own
+    event loop, so it must not touch the async pools of the shared get_llm() client.
+    Keep-alive is off, so no connections are left open when that loop closes and
+    each evaluate() leaves nothing to clean up. The provider's rate limiter is still shared.
+    """
+    return get_llm.__wrapped__(provider, keepalive=False)
+
+@lru_cache(maxsize=4)
+def load_vectorstore(embedding_provider="offline", index_dir="data/faiss_index"):
+    """
+    Loads the FAISS index once per (embedding_provider, index_dir).
+    The eval scripts call rag() once per test row, so re-deserializing the
+    docstore and re-loading the embedding model on every call is wasted work.
+    """
+    embedding_model = get_embeddings(embedding_provider)
+    vectorstore = FAISS.load_local(index_dir, embedding_model, allow_dangerous_deserialization=True)
+
+    # Swap the in-memory copy of the vectors for one read in place from a memory-mapped
+    # file (IO_FLAG_MMAP_IFC), so processes reading the same index share page-cache pages
+    # instead of each holding a private copy. Plain IO_FLAG_MMAP would not help here: it
+    # only maps IVF inverted lists, and this repo's index is an IndexFlatL2.
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if mmap_flag is not None:
+        try:
+            vectorstore.index = faiss.read_index(os.path.join(index_dir, "index.faiss"), mmap_flag)
+        except RuntimeError as e:
+            # Older FAISS builds or unsupported index types; keep the copy loaded above
+            print(f"[WARNING] Could not memory-map FAISS index, using in-memory copy: {e}")
+
+    return vectorstore
+
+def _resolve_system_prompt(system_prompt, prompt_version):
     # Check for Env Var override if argument is missing
     if system_prompt is None:
         system_prompt = os.getenv("RAG_SYSTEM_PROMPT")
@@ -142,7 +296,17 @@ def rag(query, index_dir="data/faiss_index", top_k=3, embedding_provider="offlin
         env_prompt_ver = os.getenv("RAG_PROMPT_VERSION")
         if env_prompt_ver:
             prompt_version = env_prompt_ver
+    return system_prompt, prompt_version
 
+@lru_cache(maxsize=16)
+def _build_answer_chain(llm_provider, system_prompt):
+    """
+    Builds the LCEL chain mapping {"context": [docs], "question"} to the answer string.
+    """
+    # 1. Setup LLM
+    llm = get_llm(llm_provider)
+
+    # 2. Define Prompt
     if system_prompt:
         from langchain_core.prompts import ChatPromptTemplate
         prompt = ChatPromptTemplate.from_messages([
@@ -162,59 +326,200 @@ def rag(query, index_dir="data/faiss_index", top_k=3, embedding_provider="offlin
         
     output_parser = StrOutputParser()
 
-    # 5. Define Formatting Helper
+    # 3. Define Formatting Helper
     def format_docs(docs):
         return "\n\n".join(doc.page_content for doc in docs)
 
-    # 6. Create Chain (LCEL)
-    # We want to return source documents, so we use RunnableParallel to keep 'context'
-    
-    rag_chain_from_docs = (
+    # 4. Create Chain (LCEL)
+    return (
         RunnablePassthrough.assign(context=(lambda x: format_docs(x["context"])))
         | prompt
         | llm
         | output_parser
     )
 
-    rag_chain_with_source = RunnableParallel(
+@lru_cache(maxsize=16)
+def _build_chain(llm_provider, embedding_provider, index_dir, system_prompt, top_k):
+    """
+    Builds the LCEL chain mapping a query to {"context", "question", "answer"}.
+    Memoized on its arguments, so the prompt template and pipe graph are built once
+    per configuration rather than once per query.
+    """
+    # Load the index and embeddings now, so a missing index or backend fails here (and
+    # rag() reports it) rather than on first use inside the chain
+    load_vectorstore(embedding_provider, index_dir)
+
+    # Retrieval goes through retrieve_batch so single queries share its on-disk cache
+    retriever = RunnableLambda(
+        lambda query: retrieve_batch([query], index_dir=index_dir, top_k=top_k, embedding_provider=embedding_provider)[0]
+    )
+
+    # We want to return source documents, so we use RunnableParallel to keep 'context'
+    return RunnableParallel(
         {"context": retriever, "question": RunnablePassthrough()}
-    ).assign(answer=rag_chain_from_docs)
+    ).assign(answer=_build_answer_chain(llm_provider, system_prompt))
 
-    # 4. Invoke with Retry Logic for Rate Limits
-    import time
-    max_retries = 5
-    base_delay = 20 # seconds
-    
-    print(f"Invoking RAG chain for query: '{query}'")
-    
-    final_result = None
-    for attempt in range(max_retries):
-        try:
-            final_result = rag_chain_with_source.invoke(query)
-            break # Break loop if successful
-        except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg or "Rate limit" in error_msg or "quota" in error_msg.lower():
-                wait_time = base_delay * (attempt + 1) + 60 # Aggressive backoff: 80s, 100s, 120s...
-                print(f"\n[WARNING] Rate limit hit. Sleeping {wait_time}s before retry {attempt+1}/{max_retries}...")
-                print(f"Error details: {error_msg[:200]}...") # Print snippet only
-                time.sleep(wait_time)
-            else:
-                # If it's not a rate limit, raise immediately
-                raise e
-    
-    if final_result is None:
-        raise Exception(f"Failed to process query after {max_retries} retries due to rate limits.")
-    
-    # Format output
+# Question embeddings and their retrieved documents do not depend on the prompt
+# version, so they are cached on disk and shared by every version and re-run.
+# Set RAG_EMBED_CACHE=0 to disable.
+EMBED_CACHE_DIR = "data/.embed_cache"
+
+@lru_cache(maxsize=1)
+def _get_embed_cache():
+    """
+    Disk-backed store of (embedding, retrieved docs) per query, or None if caching
+    is disabled or diskcache is not installed.
+    """
+    if os.getenv("RAG_EMBED_CACHE", "1") == "0":
+        return None
+    try:
+        import diskcache
+    except ImportError:
+        return None
+    return diskcache.Cache(EMBED_CACHE_DIR)
+
+# Providers whose embed_documents() returns exactly what embed_query() would, so one
+# batched call can embed every query. Others (e.g. vertex, which embeds documents and
+# queries with different task types) are embedded one query at a time, matching the
+# similarity_search path used by eval_retrieval.
+BATCH_QUERY_EMBEDDING_PROVIDERS = frozenset({"offline", "openai"})
+
+def _embed_queries(embedding_provider, queries):
+    embedding_model = get_embeddings(embedding_provider)
+    if embedding_provider in BATCH_QUERY_EMBEDDING_PROVIDERS:
+        return embedding_model.embed_documents(queries)
+    return [embedding_model.embed_query(q) for q in queries]
+
+def _retrieval_cache_key(query, embedding_provider, index_dir, top_k):
+    # The index file's mtime is part of the key so rebuilding the index invalidates old hits
+    index_file = os.path.join(index_dir, "index.faiss")
+    index_stamp = os.path.getmtime(index_file) if os.path.exists(index_file) else 0
+    # "query" marks entries embedded through the query path (older ones used embed_documents)
+    raw = f"query\x00{query.strip().lower()}\x00{embedding_provider}\x00{index_dir}\x00{index_stamp}\x00{top_k}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def retrieve_batch(queries, index_dir="data/faiss_index", top_k=3, embedding_provider="offline"):
+    """
+    Retrieves the top_k documents for every query with a single embedding request
+    and a single FAISS search over the whole query matrix, instead of one of each per query.
+    Queries already in the on-disk cache are not re-embedded or re-searched.
+    Returns one list of Documents per query, in input order.
+    """
+    queries = list(queries)
+    cache = _get_embed_cache()
+    keys = [_retrieval_cache_key(q, embedding_provider, index_dir, top_k) for q in queries]
+
+    results = [None] * len(queries)
+    if cache is not None:
+        for i, key in enumerate(keys):
+            hit = cache.get(key)
+            if hit is not None:
+                results[i] = hit[1]
+
+    # Embed and search the misses only, deduplicated so repeated questions cost one lookup
+    missing = {}
+    for i, q in enumerate(queries):
+        if results[i] is None:
+            missing.setdefault(keys[i], q)
+    if not missing:
+        return results
+
+    vectorstore = load_vectorstore(embedding_provider, index_dir)
+    vectors = np.asarray(_embed_queries(embedding_provider, list(missing.values())), dtype="float32")
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+
+    _, ids = vectorstore.index.search(vectors, top_k)
+    fetched = {}
+    for key, vector, row in zip(missing, vectors, ids):
+        docs = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in row if i != -1]
+        fetched[key] = docs
+        if cache is not None:
+            cache.set(key, (vector, docs))
+
+    return [docs if docs is not None else fetched[key] for docs, key in zip(results, keys)]
+
+def _format_result(query, result, prompt_version):
     return {
         "query": query,
-        "answer": final_result["answer"],
-        "retrieved_chunks": [doc.page_content for doc in final_result["context"]],
-        "retrieved_metadata": [doc.metadata for doc in final_result["context"]],
+        "answer": result["answer"],
+        "retrieved_chunks": [doc.page_content for doc in result["context"]],
+        "retrieved_metadata": [doc.metadata for doc in result["context"]],
         "prompt_version": prompt_version
     }
 
+def rag(query, index_dir="data/faiss_index", top_k=3, embedding_provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0"):
+    """
+    End-to-end RAG function using LCEL. 
+    Returns a dictionary with query, answer, and retrieved documents.
+    """
+    
+    system_prompt, prompt_version = _resolve_system_prompt(system_prompt, prompt_version)
+
+    try:
+        rag_chain_with_source = _build_chain(llm_provider, embedding_provider, index_dir, system_prompt, top_k)
+    except Exception as e:
+        return {"error": f"Failed to initialize LLM or load index/embeddings: {e}"}
+
+    # 7. Invoke with Retry Logic for Rate Limits
+    print(f"Invoking RAG chain for query: '{query}'")
+    final_result = _invoke_with_retry(rag_chain_with_source, query)
+    
+    # Format output
+    return _format_result(query, final_result, prompt_version)
+
+LONG_ANSWER_HINTS = ("explain", "list", "summarize", "describe", "compare")
+
+def pred_tokens(query, max_tokens=1024):
+    """Cheap estimate of the answer length (in tokens) a question will produce."""
+    q = query.lower()
+    return min(max_tokens, 50 + 0.5 * len(q.split()) + 200 * sum(hint in q for hint in LONG_ANSWER_HINTS))
+
+async def rag_batch(queries, index_dir="data/faiss_index", top_k=3, embedding_provider="offline", llm_provider="openai", system_prompt=None, prompt_version="prompt_v0", max_concurrency=None, on_result=None):
+    """
+    Batch variant of rag() for the eval scripts. Retrieval for all queries is done up front
+    in one embedding request and one FAISS search; the LLM calls then run concurrently,
+    at most max_concurrency in flight (default: RAG_CONCURRENCY env var, or 8).
+    Queries predicted to give long answers are started first, so they do not straggle at the end.
+    on_result(query, result), if given, is called as each query completes.
+    Returns a list of result dicts in the same shape and order as rag().
+    Run it with run_async(), not asyncio.run(), so the shared clients stay on one loop.
+    """
+    system_prompt, prompt_version = _resolve_system_prompt(system_prompt, prompt_version)
+    queries = list(queries)
+
+    try:
+        answer_chain = _build_answer_chain(llm_provider, system_prompt)
+        # Embedding and FAISS search block, so keep them off the shared event loop
+        contexts = await asyncio.to_thread(retrieve_batch, queries, index_dir=index_dir, top_k=top_k, embedding_provider=embedding_provider)
+    except Exception as e:
+        return [{"error": f"Failed to initialize LLM or load index/embeddings: {e}"} for _ in queries]
+
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("RAG_CONCURRENCY", "8"))
+
+    print(f"Invoking RAG chain for {len(queries)} queries (max concurrency: {max_concurrency})...")
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(query, docs):
+        # A query backing off on a rate limit keeps its slot, which also throttles the batch
+        async with semaphore:
+            answer = await _ainvoke_with_retry(answer_chain, {"context": docs, "question": query})
+        result = _format_result(query, {"answer": answer, "context": docs}, prompt_version)
+        if on_result:
+            on_result(query, result)
+        return result
+
+    # Semaphore slots are handed out in task-creation order, so create tasks longest-first
+    order = sorted(range(len(queries)), key=lambda i: pred_tokens(queries[i]), reverse=True)
+    results = [None] * len(queries)
+
+    async def run_at(i):
+        results[i] = await run_one(queries[i], contexts[i])
+
+    await asyncio.gather(*[run_at(i) for i in order])
+    return results
+
 if __name__ == "__main__":
     # Simple CLI test
     import argparse
@@ -1,13 +1,48 @@
 import argparse
-import subprocess
 import sys
 import os
-import json
-import time
+import re
+import orjson
+import asyncio
+import hashlib
+import threading
+import contextvars
+import shlex
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# The eval stages spend their time waiting on LLM HTTP calls on rag_pipeline's shared
+# event loop (and RAGAS's own); uvloop makes those loops cheaper when available.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 # Ensure project root is in path
 sys.path.append(os.getcwd())
 
+# Eval stages are imported once and run in-process, so heavy imports (torch, langchain,
+# ragas) and module-level caches (FAISS index, LLM clients) are shared across stages
+from src import eval_retrieval, eval_generation, eval_ragas, aggregate_scores
+from src.rag_pipeline import get_llm, load_vectorstore, rag_batch, retrieve_batch, run_async, _invoke_with_retry
+from src.summary_cache import SemanticSummaryCache
+from src.shared_data import publish_test_data, release_test_data
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+# Persistent exact-match cache for every LLM call made in this process (RAG answers,
+# RAGAS judging, change summaries): re-runs only pay for prompts not seen before.
+# Set RAG_LLM_CACHE=0 to always hit the providers.
+LLM_CACHE_PATH = "data/.rag_eval_cache.db"
+SUMMARY_CACHE_DIR = "data/.summary_cache"
+
+if os.getenv("RAG_LLM_CACHE", "1") != "0":
+    from langchain_core.globals import set_llm_cache
+    from langchain_community.cache import SQLiteCache
+    set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+
 # Define Prompt Versions
 PROMPT_VERSIONS = {
     "prompt_v0": "You are a helpful assistant. Answer the user’s question clearly and concisely.",
@@ -16,72 +51,470 @@ PROMPT_VERSIONS = {
     "prompt_v3": "You are an expert assistant.\nFirst, reason internally about what information from the retrieved context is relevant.\nThen provide a complete, well-explained answer grounded in that context.\nAvoid speculation and unsupported claims.",
     "prompt_v4": "You are an expert, evaluation-aware assistant.\n\nInstructions:\n- Ground every claim strictly in the retrieved context\n- Be complete but avoid unnecessary verbosity\n- Do not introduce external knowledge\n- If multiple interpretations exist, state them clearly\n- If the context is insufficient, say that explicitly\n\nProduce a clear, faithful, and well-structured answer."
 }
+_PROMPT_KEYS = frozenset(PROMPT_VERSIONS)
 
-def run_command(command, description, env=None):
+async def run_command_async(argv, description, env=None):
+    """
+    Runs a command (an argv list, exec'd directly without a shell) and streams its
+    combined stdout/stderr, each line prefixed with [description] so the output of
+    concurrent stages stays readable. Returns the exit code.
+    """
     print(f"\n🚀 {description}...")
-    print(f"   Command: {command}")
+    print(f"   Command: {shlex.join(argv)}")
+    env = dict(env if env else os.environ)
+    # Children write to a pipe, not a TTY: unbuffered so their lines arrive as they happen
+    env["PYTHONUNBUFFERED"] = "1"
     try:
-        # Stream output to console in real-time
-        process = subprocess.Popen(
-            command, 
-            shell=True, 
-            stdout=sys.stdout,
-            stderr=sys.stderr,
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
             cwd=os.getcwd(),
-            env=env if env else os.environ.copy()
+            env=env
         )
-        process.wait()
-        
-        if process.returncode != 0:
-            print(f"❌ {description} failed with exit code {process.returncode}")
-            sys.exit(process.returncode)
-        else:
-            print(f"✅ {description} completed.")
-            
     except Exception as e:
         print(f"❌ Error executing {description}: {e}")
-        sys.exit(1)
+        return 1
+
+    # Split on \r too, so progress bars redrawing one line don't build an unbounded line
+    pending = b""
+    while chunk := await process.stdout.read(65536):
+        *lines, pending = re.split(rb"[\r\n]", pending + chunk)
+        for line in lines:
+            if line.strip():
+                print(f"[{description}] {line.decode(errors='replace').rstrip()}", flush=True)
+    if pending.strip():
+        print(f"[{description}] {pending.decode(errors='replace').rstrip()}", flush=True)
+
+    await process.wait()
+    if process.returncode != 0:
+        print(f"❌ {description} failed with exit code {process.returncode}")
+    else:
+        print(f"✅ {description} completed.")
+    return process.returncode
+
+async def run_commands_async(commands):
+    """
+    Runs (argv, description, env) commands concurrently and returns their exit codes.
+    Every command is awaited, so a failure in one stage does not orphan the others.
+    """
+    return await asyncio.gather(*[run_command_async(argv, description, env=env) for argv, description, env in commands])
+
+def run_command(argv, description, env=None):
+    code = asyncio.run(run_command_async(argv, description, env=env))
+    if code:
+        sys.exit(code)
+
+# Label of the in-process stage the current code runs for; None outside a stage.
+# Context variables follow the stage into rag_pipeline.run_async coroutines and to_thread workers.
+_stage_label = contextvars.ContextVar("stage_label", default=None)
+
+class _StagePrefixedStdout:
+    """
+    Stdout wrapper giving in-process stages the same "[description] ..." line prefixes
+    as subprocess stages, so concurrent stages sharing one stdout stay readable.
+    Text is written a whole line at a time; output outside a stage passes through.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def write(self, text):
+        label = _stage_label.get()
+        if label is None:
+            return self._stream.write(text)
+        with self._lock:
+            *lines, self._pending[label] = (self._pending.get(label, "") + text).split("\n")
+            for line in lines:
+                self._stream.write(f"[{label}] {line}\n")
+        return len(text)
+
+    def flush_label(self, label):
+        with self._lock:
+            rest = self._pending.pop(label, "")
+            if rest:
+                self._stream.write(f"[{label}] {rest}\n")
+        self._stream.flush()
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+def _run_stage(func, description, kwargs):
+    """
+    Runs an eval stage's main() in-process and returns its exit code (0 on success),
+    mirroring what run_command_async reports for a subprocess. Lines the stage prints
+    are prefixed with [description].
+    """
+    print(f"\n🚀 {description}...")
+    token = _stage_label.set(description)
+    try:
+        func(**kwargs)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            code = e.code if isinstance(e.code, int) else 1
+            print(f"❌ {description} failed with exit code {code}")
+            return code
+    except Exception as e:
+        print(f"❌ Error executing {description}: {e}")
+        traceback.print_exc()
+        return 1
+    finally:
+        _stage_label.reset(token)
+        if isinstance(sys.stdout, _StagePrefixedStdout):
+            sys.stdout.flush_label(description)
+    print(f"✅ {description} completed.")
+    return 0
+
+# Stage kwargs that subprocesses receive through env vars instead of CLI flags
+_ENV_KWARGS = {"system_prompt": "RAG_SYSTEM_PROMPT", "prompt_version": "RAG_PROMPT_VERSION"}
+
+def _stage_command(module, kwargs):
+    """
+    Builds the CLI equivalent of an in-process stage: each kwarg maps onto the
+    script's --flag of the same name. Returns (argv, env).
+    """
+    script = f"src/{module.__name__.rsplit('.', 1)[-1]}.py"
+    env = os.environ.copy()
+    # sys.executable rather than "python", so stages run in this interpreter's environment
+    argv = [sys.executable, script]
+    for key, value in kwargs.items():
+        if value is None:
+            continue
+        if key in _ENV_KWARGS:
+            env[_ENV_KWARGS[key]] = value
+        else:
+            argv.extend([f"--{key}", str(value)])
+    return argv, env
+
+def _warm_stage_caches(stages):
+    """
+    Loads the FAISS index, embedding model and LLM client each stage will use, once,
+    before the stages start. lru_cache does not serialize first calls, so parallel
+    stages missing the cache together would each load their own copy.
+    Failures are left for the stages themselves to report.
+    """
+    indexes = {(kwargs.get("provider", "offline"), kwargs.get("index_dir", "data/faiss_index")) for _, _, kwargs in stages}
+    llm_providers = {kwargs["llm_provider"] for _, _, kwargs in stages if "llm_provider" in kwargs}
+    for warm, args in [(load_vectorstore, key) for key in indexes] + [(get_llm, (p,)) for p in llm_providers]:
+        try:
+            warm(*args)
+        except Exception:
+            pass
+
+def run_stages(stages, parallel=False, use_subprocess=False):
+    """
+    Runs a list of (module, description, kwargs) eval stages by calling module.main(**kwargs).
+    With parallel=True the stages run concurrently and all of them are joined before
+    exiting; otherwise they run in order and stop at the first failure.
+    With use_subprocess=True each stage runs as `<sys.executable> src/<module>.py` instead.
+    Exits with the first non-zero exit code, like run_command.
+    """
+    if use_subprocess:
+        commands = [(*_stage_command(module, kwargs), description) for module, description, kwargs in stages]
+        if parallel:
+            codes = asyncio.run(run_commands_async([(argv, description, env) for argv, env, description in commands]))
+            failed_code = next((code for code in codes if code), 0)
+            if failed_code:
+                sys.exit(failed_code)
+        else:
+            for argv, env, description in commands:
+                run_command(argv, description, env=env)
+        return
+
+    if not isinstance(sys.stdout, _StagePrefixedStdout):
+        sys.stdout = _StagePrefixedStdout(sys.stdout)
+
+    if parallel:
+        _warm_stage_caches(stages)
+        with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+            codes = list(executor.map(lambda stage: _run_stage(stage[0].main, stage[1], stage[2]), stages))
+    else:
+        codes = []
+        for module, description, kwargs in stages:
+            codes.append(_run_stage(module.main, description, kwargs))
+            if codes[-1]:
+                break
+
+    failed_code = next((code for code in codes if code), 0)
+    if failed_code:
+        sys.exit(failed_code)
+
+# Static instructions for change summaries. Kept byte-identical across calls: the two
+# responses only go into the human message, so the instructions are also a stable part
+# of the summary cache keys. (At ~80 tokens they are far below the 1024-token minimum
+# for OpenAI's automatic prompt caching, which gpt-3.5-turbo does not offer anyway.)
+CHANGE_SUMMARY_SYSTEM_PROMPT = """You are an expert editor comparing two AI responses to the same question.
+
+You will be given a Baseline Response and a New Response.
+Briefly describe how the New Response differs from the Baseline in meaning, detail, or completeness.
+Focus on the *quality* of the change (e.g. "more grounded", "less hallucination", "better structure").
+Keep it under 2 sentences."""
+
+_COMPARE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CHANGE_SUMMARY_SYSTEM_PROMPT),
+    ("human", "Baseline Response:\n{baseline}\n\nNew Response:\n{new}")
+])
+
+@lru_cache(maxsize=8)
+def _get_compare_chain(llm_provider):
+    """Builds the change-summary chain once per provider; the responses are filled in at invoke time."""
+    return _COMPARE_PROMPT | get_llm(llm_provider) | StrOutputParser()
+
+@lru_cache(maxsize=1)
+def _get_summary_cache():
+    """
+    Disk-backed store of change summaries, or None if caching is disabled or
+    diskcache is not installed.
+    """
+    if os.getenv("RAG_LLM_CACHE", "1") == "0":
+        return None
+    try:
+        import diskcache
+    except ImportError:
+        return None
+    return diskcache.Cache(SUMMARY_CACHE_DIR)
+
+def _summary_cache_key(baseline_response, new_response, llm_provider):
+    # The instructions are part of the key so editing them invalidates old summaries
+    parts = [llm_provider, CHANGE_SUMMARY_SYSTEM_PROMPT, baseline_response, new_response]
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+@lru_cache(maxsize=8)
+def _get_semantic_cache(llm_provider):
+    """
+    Embedding-similarity cache of change summaries for this provider and instructions,
+    or None if caching is disabled or the cache cannot be opened.
+    """
+    if os.getenv("RAG_LLM_CACHE", "1") == "0":
+        return None
+    try:
+        return SemanticSummaryCache(namespace=f"{llm_provider}\x00{CHANGE_SUMMARY_SYSTEM_PROMPT}")
+    except Exception as e:
+        print(f"[WARNING] Semantic summary cache unavailable: {e}")
+        return None
+
+def _lookup_summary(baseline_response, new_response, llm_provider):
+    """
+    Checks the exact-match cache, then the semantic cache, for a summary of this pair.
+    Returns (summary or None, vector); pass vector to _store_summary() on a miss.
+    """
+    cache = _get_summary_cache()
+    cache_key = _summary_cache_key(baseline_response, new_response, llm_provider)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, None
+
+    semcache = _get_semantic_cache(llm_provider)
+    if semcache is None:
+        return None, None
+    try:
+        cached, vector = semcache.lookup(baseline_response, new_response)
+    except Exception as e:
+        print(f"[WARNING] Semantic summary cache lookup failed: {e}")
+        return None, None
+    if cached is not None and cache is not None:
+        cache.set(cache_key, cached)
+    return cached, vector
+
+def _store_summary(baseline_response, new_response, llm_provider, summary, vector):
+    cache = _get_summary_cache()
+    if cache is not None:
+        cache.set(_summary_cache_key(baseline_response, new_response, llm_provider), summary)
+    if vector is not None:
+        _get_semantic_cache(llm_provider).add(vector, summary)
 
 def generate_change_summary(baseline_response, new_response, llm_provider):
     """
     Generates a brief summary of how the new response differs from the baseline.
-    Uses the same LLM provider as the main run.
+    Uses the same LLM provider as the main run. Summaries are cached on disk, keyed by
+    (provider, baseline, new), so unchanged pairs are not re-summarized on re-runs;
+    pairs close enough to one summarized before reuse its summary via the semantic cache.
     """
-    try:
-        # Import internally to avoid circular dependencies if simple import
-        from src.rag_pipeline import get_llm
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
+    cached, vector = _lookup_summary(baseline_response, new_response, llm_provider)
+    if cached is not None:
+        return cached
+    return _summarize_pair(baseline_response, new_response, llm_provider, vector)
 
-        llm = get_llm(llm_provider)
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an expert editor comparing two AI responses."),
-            ("human", f"""Compare the following two responses to the same question.
-            
-            Baseline Response:
-            {baseline_response}
-            
-            New Response:
-            {new_response}
-            
-            Briefly describe how the second answer differs from the first in meaning, detail, or completeness.
-            Focus on the *quality* of the change (e.g. "more grounded", "less hallucination", "better structure").
-            Keep it under 2 sentences.
-            """)
-        ])
-        
-        chain = prompt | llm | StrOutputParser()
-        return chain.invoke({})
+def _summarize_pair(baseline_response, new_response, llm_provider, vector):
+    # Cache miss path: one LLM call, then store under the key/vector the lookup produced
+    try:
+        summary = _invoke_with_retry(
+            _get_compare_chain(llm_provider),
+            {"baseline": baseline_response, "new": new_response}
+        )
+        _store_summary(baseline_response, new_response, llm_provider, summary, vector)
+        return summary
     except Exception as e:
         print(f"[WARNING] Failed to generate change summary: {e}")
         return "Comparison failed."
 
-def run_prompt_version_eval(llm_provider, prompt_versions_to_run, use_synthetic):
+# Batched variant: several pairs per request, answered as one JSON array.
+# The per-pair instructions are reused so batched and single summaries read the same.
+CHANGE_SUMMARY_BATCH_PROMPT = CHANGE_SUMMARY_SYSTEM_PROMPT + """
+
+You will be given several numbered pairs. Summarize each pair independently.
+Respond with only a JSON array containing one object per pair, in order:
+[{{"id": 1, "summary": "..."}}, {{"id": 2, "summary": "..."}}]"""
+
+# The braces in the example reply are doubled so the template reads them as literals
+_COMPARE_BATCH_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CHANGE_SUMMARY_BATCH_PROMPT),
+    ("human", "{pairs}")
+])
+assert _COMPARE_BATCH_PROMPT.input_variables == ["pairs"], _COMPARE_BATCH_PROMPT.input_variables
+
+@lru_cache(maxsize=8)
+def _get_compare_batch_chain(llm_provider):
+    return _COMPARE_BATCH_PROMPT | get_llm(llm_provider) | StrOutputParser()
+
+def _parse_batch_summaries(text, count):
+    """
+    Extracts the summaries from the model's JSON array reply.
+    Returns a list of length count, with None for any id the reply is missing.
+    """
+    summaries = [None] * count
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        return summaries
+    try:
+        items = orjson.loads(text[start:end + 1])
+    except orjson.JSONDecodeError:
+        return summaries
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        idx, summary = item.get("id"), item.get("summary")
+        if isinstance(idx, int) and 1 <= idx <= count and isinstance(summary, str) and summary:
+            summaries[idx - 1] = summary
+    return summaries
+
+def _summarize_batch(batch, llm_provider):
+    """
+    Summarizes a list of (baseline, new, vector) pairs with one LLM request. Pairs the
+    reply leaves out (or a failed request) fall back to one single-pair LLM call each.
+    """
+    pairs_text = "\n\n".join(
+        f"Pair {i}\nBaseline Response:\n{baseline}\n\nNew Response:\n{new}"
+        for i, (baseline, new, _) in enumerate(batch, start=1)
+    )
+    try:
+        reply = _invoke_with_retry(_get_compare_batch_chain(llm_provider), {"pairs": pairs_text})
+        summaries = _parse_batch_summaries(reply, len(batch))
+    except Exception as e:
+        print(f"[WARNING] Batched change summary failed, summarizing pairs one by one: {e}")
+        summaries = [None] * len(batch)
+
+    for i, (baseline, new, vector) in enumerate(batch):
+        if summaries[i] is None:
+            # Already looked up (and embedded) by the caller, so go straight to the LLM
+            summaries[i] = _summarize_pair(baseline, new, llm_provider, vector)
+        else:
+            _store_summary(baseline, new, llm_provider, summaries[i], vector)
+    return summaries
+
+def generate_change_summaries_batched(pairs, llm_provider, batch_size=10, on_result=None):
+    """
+    Summarizes a list of (baseline_response, new_response) pairs, packing up to
+    batch_size uncached pairs into each LLM request. Requests run concurrently like
+    the per-pair path. Returns the summaries in input order; on_result(index, summary),
+    if given, is called as each one becomes available.
+    """
+    summaries = [None] * len(pairs)
+    todo = []
+    for i, (baseline, new) in enumerate(pairs):
+        cached, vector = _lookup_summary(baseline, new, llm_provider)
+        if cached is not None:
+            summaries[i] = cached
+            if on_result:
+                on_result(i, cached)
+        else:
+            todo.append((i, vector))
+
+    batches = [todo[start:start + batch_size] for start in range(0, len(todo), batch_size)]
+
+    def store_batch(batch, batch_summaries):
+        for (i, _), summary in zip(batch, batch_summaries):
+            summaries[i] = summary
+            if on_result:
+                on_result(i, summary)
+
+    run_async(_gather_in_threads(
+        lambda batch: _summarize_batch([(*pairs[i], vector) for i, vector in batch], llm_provider),
+        batches,
+        on_result=store_batch
+    ))
+
+    semcache = _get_semantic_cache(llm_provider)
+    if semcache is not None:
+        semcache.save()
+    return summaries
+
+async def _gather_in_threads(func, items, on_result=None):
+    """
+    Runs the blocking func(item) for every item on worker threads, with at most
+    RAG_CONCURRENCY (default 8) in flight. Results are returned in input order;
+    on_result(item, result), if given, is called as each one completes.
+    """
+    semaphore = asyncio.Semaphore(int(os.getenv("RAG_CONCURRENCY", "8")))
+
+    async def run_one(item):
+        async with semaphore:
+            result = await asyncio.to_thread(func, item)
+        if on_result:
+            on_result(item, result)
+        return result
+
+    return await asyncio.gather(*[run_one(item) for item in items])
+
+def _journal_entry(journal_file, question, p_ver, entry):
+    """
+    Appends one {question, prompt_version, entry} record to the JSONL journal.
+    Constant cost per question, unlike rewriting the whole results file.
+    """
+    with open(journal_file, "ab") as f:
+        f.write(orjson.dumps({"q": question, "v": p_ver, "entry": entry}) + b"\n")
+
+def _replay_journal(journal_file, full_results):
+    """
+    Folds records left in the journal by an interrupted run back into full_results
+    (later records win). A torn final line from a crash is ignored.
+    """
+    if not os.path.exists(journal_file):
+        return
+    with open(journal_file, "rb") as f:
+        for line in f:
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                break
+            question = record["q"]
+            full_results.setdefault(question, {"question": question, "prompt_results": {}})
+            full_results[question]["prompt_results"][record["v"]] = record["entry"]
+
+def _save_results(full_results, output_file):
+    """
+    Compacts the in-memory results into the nested JSON file. Dumps to a temp file and
+    os.replace()s it over the target so a crash never leaves a half-written JSON.
+    """
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(orjson.dumps(full_results, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_file, output_file)
+
+# Retrieval scores shared by every prompt version of a run
+_retrieval_scores = {}
+
+def run_prompt_version_eval(llm_provider, prompt_versions_to_run, use_synthetic, use_subprocess=False):
     """
     Runs the RAG pipeline for specified prompt versions and saves structured output.
+    Eval stages run in-process unless use_subprocess is set.
     """
-    from src.rag_pipeline import rag
     
     # 1. Load Test Data
     suffix = "_synthetic.json" if use_synthetic else ".json"
@@ -91,120 +524,179 @@ def run_prompt_version_eval(llm_provider, prompt_versions_to_run, use_synthetic)
         print(f"❌ Test file not found: {test_file}")
         return
 
-    with open(test_file, 'r') as f:
-        test_data = json.load(f)
+    with open(test_file, 'rb') as f:
+        test_data = orjson.loads(f.read())
 
     results_dir = "data/prompt_versions"
     os.makedirs(results_dir, exist_ok=True)
     output_file = f"{results_dir}/prompt_impact_analysis.json"
+    # Per-question records are appended here while a version runs, then compacted into output_file
+    journal_file = output_file + ".jsonl"
     
     # Load existing results if any to preserve baseline
     if os.path.exists(output_file):
-        with open(output_file, 'r') as f:
-            full_results = json.load(f)
+        with open(output_file, 'rb') as f:
+            full_results = orjson.loads(f.read())
     else:
         full_results = {}
+    
+    # Recover answers from an interrupted run
+    _replay_journal(journal_file, full_results)
+
+    # Pre-warm the retrieval cache: every unique question is embedded and searched once
+    # here, and each version's generation and eval stages then reuse the stored contexts
+    questions = list(dict.fromkeys(item["query"] for item in test_data if item.get("query")))
+    if questions:
+        try:
+            retrieve_batch(questions)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not pre-warm retrieval cache: {e}")
 
     print(f"\n🔬 Starting Prompt Version Analysis for: {prompt_versions_to_run}")
+
+    # In subprocess mode, parse the test files once here and share them with every stage process
+    shm = None
+    if use_subprocess:
+        shm = publish_test_data([f"data/test_{kind}{suffix}" for kind in ("retrieval", "generation", "ragas")])
+
+    try:
+        # Retrieval does not depend on the prompt, so score it once for all versions.
+        # Its score file stays in data/results for every version's aggregate step.
+        run_stages([
+            (eval_retrieval, "Eval Retrieval", {"test_file": f"data/test_retrieval{suffix}"}),
+        ], use_subprocess=use_subprocess)
+        _retrieval_scores.clear()
+        retrieval_path = "data/results/retrieval_score.json"
+        if os.path.exists(retrieval_path):
+            with open(retrieval_path, 'rb') as f:
+                _retrieval_scores["retrieval"] = orjson.loads(f.read()).get("retrieval_score", 0)
     
-    for p_ver in prompt_versions_to_run:
-        # Load fresh or existing results
-        if os.path.exists(output_file):
-            with open(output_file, 'r') as f:
-                full_results = json.load(f)
-        else:
-             full_results = {}
-             
-        # Step 1: Generate Responses & Baseline Comparison (Detailed View)
-        # We need to ensure we have the response text first
+        for p_ver in prompt_versions_to_run:
+            # Step 1: Generate Responses & Baseline Comparison (Detailed View)
+            # We need to ensure we have the response text first
         
-        # Check if we need to run RAG generation for this version?
-        # Yes, to populate the 'response' and 'change_summary' fields in the detailed JSON
-        print(f"\n--- Processing {p_ver} ---")
+            # Check if we need to run RAG generation for this version?
+            # Yes, to populate the 'response' and 'change_summary' fields in the detailed JSON
+            print(f"\n--- Processing {p_ver} ---")
+            sys_prompt = PROMPT_VERSIONS[p_ver]
         
-        # 1.1 Generation Loop (Per Query)
-        # We only need to do this if we don't have the response yet (or forced)
-        # But to be safe and consistent, we should probably run it unless we want to rely on the eval scripts?
-        # The user wants "Response" and "Metadata" in the JSON. Eval scripts don't easily give metadata per query in a structured way.
-        # So we keep the generation loop.
+            # 1.1 Generation Loop (Per Query)
+            # We only need to do this if we don't have the response yet (or forced)
+            # But to be safe and consistent, we should probably run it unless we want to rely on the eval scripts?
+            # The user wants "Response" and "Metadata" in the JSON. Eval scripts don't easily give metadata per query in a structured way.
+            # So we keep the generation loop.
         
-        for item in test_data:
-            question = item.get("query")
-            if not question: continue
+            pending = []
+            for item in test_data:
+                question = item.get("query")
+                if not question: continue
             
-            if question not in full_results:
-                full_results[question] = {"question": question, "prompt_results": {}}
+                if question not in full_results:
+                    full_results[question] = {"question": question, "prompt_results": {}}
             
-            if p_ver not in full_results[question]["prompt_results"]:
-                print(f"   Generating {p_ver} response for: '{question[:30]}...'")
-                sys_prompt = PROMPT_VERSIONS.get(p_ver)
-                res = rag(question, llm_provider=llm_provider, system_prompt=sys_prompt, prompt_version=p_ver)
-                
-                entry = {
-                    "response": res["answer"],
-                    "metadata": {k:v for k,v in res.items() if k != "answer"}
-                }
-                
-                # If not baseline, generate summary
-                if p_ver != "prompt_v0":
-                    # Ensure baseline exists (it should, if we processed v0 first)
-                    # Implementation detail: User constraints say v0 is baseline.
-                    # If v0 is not in results, we should probably error or generate it first.
-                    # For now assuming v0 is generated first or exists.
-                    if "prompt_v0" in full_results[question]["prompt_results"]:
-                        baseline_resp = full_results[question]["prompt_results"]["prompt_v0"]["response"]
-                        entry["change_summary"] = generate_change_summary(baseline_resp, res["answer"], llm_provider)
-                
-                full_results[question]["prompt_results"][p_ver] = entry
-                
-                # Save intermediate
-                with open(output_file, 'w') as f:
-                    json.dump(full_results, f, indent=2)
-                time.sleep(2)
-
-        # Step 2: Run Full Evaluation Suite for this Version (Aggregate Scores)
-        # We use Env Vars to force the pipeline to use this prompt version
-        print(f"   Running Evaluation Scripts for {p_ver}...")
-        
-        # Set Env Vars for subprocesses
-        env = os.environ.copy()
-        env["RAG_SYSTEM_PROMPT"] = PROMPT_VERSIONS[p_ver]
-        env["RAG_PROMPT_VERSION"] = p_ver
-        
-        # 2.1 Eval Retrieval (Optional? But user asked for retrieval score)
-        # Retrieval shouldn't change with prompt, but we run it to get the score in the final report
-        run_command(f"python src/eval_retrieval.py --test_file data/test_retrieval{suffix}", f"Eval Retrieval ({p_ver})", env=env)
-        
-        # 2.2 Eval Generation
-        run_command(f"python src/eval_generation.py --test_file data/test_generation{suffix} --llm_provider {llm_provider}", f"Eval Generation ({p_ver})", env=env)
+                prompt_results = full_results[question]["prompt_results"]
+                if p_ver not in prompt_results:
+                    pending.append(question)
+                else:
+                    # Drop per-question score copies left by older runs; _meta holds them now
+                    prompt_results[p_ver].pop("scores", None)
+
+            if pending:
+                # Questions are independent, so overlap their LLM round-trips
+                print(f"   Generating {p_ver} responses for {len(pending)} questions...")
+
+                def store_response(question, res):
+                    entry = {
+                        "response": res["answer"],
+                        "metadata": {k:v for k,v in res.items() if k != "answer"}
+                    }
+                    full_results[question]["prompt_results"][p_ver] = entry
+                    _journal_entry(journal_file, question, p_ver, entry)
+
+                # One batched retrieval for all pending questions, then concurrent LLM calls
+                results = run_async(rag_batch(
+                    pending,
+                    llm_provider=llm_provider,
+                    system_prompt=sys_prompt,
+                    prompt_version=p_ver,
+                    on_result=store_response
+                ))
+                if results and "error" in results[0]:
+                    print(f"❌ Failed to generate {p_ver} responses: {results[0]['error']}")
+                    return
+
+            # If not baseline, summarize changes once all new responses are known
+            if p_ver != "prompt_v0":
+                # Ensure baseline exists (it should, if we processed v0 first)
+                # Implementation detail: User constraints say v0 is baseline.
+                # If v0 is not in results, we should probably error or generate it first.
+                # For now assuming v0 is generated first or exists.
+                # Every answer still missing its summary, including ones an interrupted run
+                # journaled before summarizing (those are no longer in pending)
+                to_compare = [
+                    q for q in questions
+                    if "prompt_v0" in full_results[q]["prompt_results"]
+                    and p_ver in full_results[q]["prompt_results"]
+                    and "change_summary" not in full_results[q]["prompt_results"][p_ver]
+                ]
+
+                def store_summary(idx, summary):
+                    question = to_compare[idx]
+                    entry = full_results[question]["prompt_results"][p_ver]
+                    entry["change_summary"] = summary
+                    _journal_entry(journal_file, question, p_ver, entry)
+
+                # Several pairs per LLM request instead of one request per question
+                generate_change_summaries_batched(
+                    [
+                        (full_results[q]["prompt_results"]["prompt_v0"]["response"],
+                         full_results[q]["prompt_results"][p_ver]["response"])
+                        for q in to_compare
+                    ],
+                    llm_provider,
+                    on_result=store_summary
+                )
+
+            # Step 2: Run Full Evaluation Suite for this Version (Aggregate Scores)
+            # The system prompt is passed to the stages directly (or via env vars in subprocess mode)
+            print(f"   Running Evaluation Scripts for {p_ver}...")
+            prompt_kwargs = {"system_prompt": sys_prompt, "prompt_version": p_ver}
         
-        # 2.3 Eval RAGAS
-        run_command(f"python src/eval_ragas.py --test_file data/test_ragas{suffix} --llm_provider {llm_provider}", f"Eval RAGAS ({p_ver})", env=env)
+            # 2.1 Eval Retrieval ran once before the loop
+            # 2.2-2.3 have no data dependency on each other, so they run concurrently
+            run_stages([
+                # 2.2 Eval Generation
+                (eval_generation, f"Eval Generation ({p_ver})", {"test_file": f"data/test_generation{suffix}", "llm_provider": llm_provider, **prompt_kwargs}),
+                # 2.3 Eval RAGAS
+                (eval_ragas, f"Eval RAGAS ({p_ver})", {"test_file": f"data/test_ragas{suffix}", "llm_provider": llm_provider, **prompt_kwargs}),
+            ], parallel=True, use_subprocess=use_subprocess)
         
-        # 2.4 Aggregate
-        run_command(f"python src/aggregate_scores.py --save_name {p_ver}", f"Aggregate Scores ({p_ver})", env=env)
+            # 2.4 Aggregate (barrier: needs all three score files)
+            run_stages([
+                (aggregate_scores, f"Aggregate Scores ({p_ver})", {"save_name": p_ver}),
+            ], use_subprocess=use_subprocess)
         
-        # Step 3: Harvest Scores and Attach to JSON
-        report_path = f"data/results/report_{p_ver}.json"
-        if os.path.exists(report_path):
-            with open(report_path, 'r') as f:
-                scores = json.load(f)
-            
-            # Attach these scores to EVERY question entry for this prompt version
-            # (As per requirement "Attach evaluation scores... to the output JSON")
-            print(f"   Attaching scores from {report_path}...")
+            # Step 3: Harvest Scores and Attach to JSON
+            report_path = f"data/results/report_{p_ver}.json"
+            if os.path.exists(report_path):
+                with open(report_path, 'rb') as f:
+                    scores = orjson.loads(f.read())
             
-            for q in full_results:
-                if p_ver in full_results[q]["prompt_results"]:
-                    # Create a copy of scores to add prompt_version metadata if missing
-                    score_entry = scores.copy()
-                    score_entry["prompt_version"] = p_ver
-                    full_results[q]["prompt_results"][p_ver]["scores"] = score_entry
-            
-            with open(output_file, 'w') as f:
-                json.dump(full_results, f, indent=2)
-        else:
-            print(f"⚠️ Warning: Report file {report_path} not found. Scores not attached.")
+                # The scores are the same for every question of this version, so they are
+                # stored once under _meta rather than copied into each question entry
+                print(f"   Attaching scores from {report_path}...")
+                score_entry = {**scores, **_retrieval_scores, "prompt_version": p_ver}
+                full_results.setdefault("_meta", {}).setdefault("scores", {})[p_ver] = score_entry
+            else:
+                print(f"⚠️ Warning: Report file {report_path} not found. Scores not attached.")
+        
+            # Compact this version into the nested JSON; the journal is no longer needed
+            _save_results(full_results, output_file)
+            if os.path.exists(journal_file):
+                os.remove(journal_file)
+    finally:
+        if shm is not None:
+            release_test_data(shm)
 
     print(f"\n✅ Prompt Analysis Complete. Results saved to: {output_file}")
 
@@ -215,6 +707,8 @@ def main():
     parser.add_argument("--run_name", type=str, default=None, help="Name for the final report (e.g. 'groq_v1')")
     parser.add_argument("--use_synthetic", action="store_true", default=True, help="Use synthetic data files (default: True)")
     
+    parser.add_argument("--subprocess", action="store_true", help="Run each eval stage as a separate Python subprocess instead of in-process")
+    
     # New Argument for Prompt Versions
     parser.add_argument("--prompt_versions", type=str, default=None, help="Comma-separated list of prompt versions to run (e.g. 'prompt_v0,prompt_v1'). If None, runs standard eval.")
 
@@ -234,46 +728,29 @@ def main():
         versions_to_run = [v.strip() for v in args.prompt_versions.split(",")]
         # Validate versions
         for v in versions_to_run:
-            if v not in PROMPT_VERSIONS:
+            if v not in _PROMPT_KEYS:
                 print(f"❌ Error: Unknown prompt version '{v}'. Available: {list(PROMPT_VERSIONS.keys())}")
                 sys.exit(1)
         
-        run_prompt_version_eval(args.llm_provider, versions_to_run, args.use_synthetic)
+        run_prompt_version_eval(args.llm_provider, versions_to_run, args.use_synthetic, use_subprocess=args.subprocess)
         return # Exit main after prompt analysis
 
     # --- STANDARD EVALUATION FLOW (Original) ---
     
-    # 1. Eval Retrieval
-    run_command(
-        f"python src/eval_retrieval.py --test_file {files['retrieval']}",
-        "Evaluating Retrieval (Recall)"
-    )
-    
-    import time
-    print("⏳ Sleeping 10s before Generation eval...")
-    time.sleep(10)
-
-    # 2. Eval Generation
-    run_command(
-        f"python src/eval_generation.py --test_file {files['generation']} --llm_provider {args.llm_provider}",
-        "Evaluating Generation (Factuality)"
-    )
+    # 1-3. Retrieval, Generation and RAGAS have no data dependency on each other,
+    # so run them concurrently. Every chat model call (including RAGAS judging) is paced by
+    # the provider's shared rate limiter from get_llm, and 429s are retried with backoff
+    # (rag_pipeline's retry for RAG/summary calls, RAGAS's RunConfig for judge calls).
+    run_stages([
+        (eval_retrieval, "Evaluating Retrieval (Recall)", {"test_file": files["retrieval"]}),
+        (eval_generation, "Evaluating Generation (Factuality)", {"test_file": files["generation"], "llm_provider": args.llm_provider}),
+        (eval_ragas, "Evaluating RAGAS (Reasoning)", {"test_file": files["ragas"], "llm_provider": args.llm_provider}),
+    ], parallel=True, use_subprocess=args.subprocess)
     
-    print("⏳ Sleeping 30s before RAGAS eval (Heavy API usage)...")
-    time.sleep(30)
-    
-    # 3. Eval RAGAS
-    run_command(
-        f"python src/eval_ragas.py --test_file {files['ragas']} --llm_provider {args.llm_provider}",
-        "Evaluating RAGAS (Reasoning)"
-    )
-    
-    # 4. Aggregate
-    save_flag = f"--save_name {args.run_name}" if args.run_name else ""
-    run_command(
-        f"python src/aggregate_scores.py {save_flag}",
-        "Aggregating Final RQI Score"
-    )
+    # 4. Aggregate (barrier: reads the score files written by all three stages)
+    run_stages([
+        (aggregate_scores, "Aggregating Final RQI Score", {"save_name": args.run_name}),
+    ], use_subprocess=args.subprocess)
     
     print("\n🎉 Full Evaluation Suite Finished Successfully!")
 
@@ -0,0 +1,70 @@
+import os
+import orjson
+from functools import lru_cache
+from multiprocessing import shared_memory, resource_tracker
+
+# Set by run_eval.py when it hands parsed test files to eval subprocesses
+SHM_ENV = "RAG_TEST_DATA_SHM"
+SHM_SIZE_ENV = "RAG_TEST_DATA_SHM_SIZE"
+
+def publish_test_data(paths):
+    """
+    Parses the given test files once and copies them into a shared memory segment
+    as one {path: data} JSON payload. Child processes inherit its name and size via
+    RAG_TEST_DATA_SHM / RAG_TEST_DATA_SHM_SIZE and read it through load_test_data().
+    Returns the segment; pass it to release_test_data() when the children are done.
+    """
+    payload = {}
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                payload[os.path.normpath(path)] = orjson.loads(f.read())
+
+    buf = orjson.dumps(payload)
+    shm = shared_memory.SharedMemory(create=True, size=max(len(buf), 1))
+    shm.buf[:len(buf)] = buf
+    os.environ[SHM_ENV] = shm.name
+    os.environ[SHM_SIZE_ENV] = str(len(buf))
+    return shm
+
+def release_test_data(shm):
+    os.environ.pop(SHM_ENV, None)
+    os.environ.pop(SHM_SIZE_ENV, None)
+    shm.close()
+    shm.unlink()
+
+def _attach(name):
+    # The parent owns the segment: children must not unlink it when they exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag; drop the registration by hand instead
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+@lru_cache(maxsize=1)
+def _shared_payload(name, size):
+    try:
+        shm = _attach(name)
+    except FileNotFoundError:
+        return {}
+    try:
+        return orjson.loads(bytes(shm.buf[:size]))
+    finally:
+        shm.close()
+
+def load_test_data(test_file):
+    """
+    Returns the parsed contents of test_file, taken from the parent's shared memory
+    segment when one is advertised and holds that file, otherwise read from disk.
+    """
+    name = os.getenv(SHM_ENV)
+    if name:
+        payload = _shared_payload(name, int(os.getenv(SHM_SIZE_ENV, "0")))
+        key = os.path.normpath(test_file)
+        if key in payload:
+            return payload[key]
+
+    with open(test_file, "rb") as f:
+        return orjson.loads(f.read())
@@ -0,0 +1,98 @@
+import os
+import hashlib
+import threading
+import orjson
+import numpy as np
+import faiss
+
+try:
+    from src.embed_store import get_embeddings
+except ImportError:
+    from embed_store import get_embeddings
+
+SEMCACHE_DIR = "data/.summary_semcache"
+# Baseline and new cosine similarities must both reach this for a stored summary to be reused
+SIMILARITY_THRESHOLD = float(os.getenv("RAG_SUMMARY_SIM_THRESHOLD", "0.95"))
+
+class SemanticSummaryCache:
+    """
+    Reuses a change summary when a near-identical (baseline, new) pair has been
+    summarized before, where an exact-match cache would miss on small wording changes.
+
+    Each pair is stored as the normalized baseline and new embeddings side by side
+    (scaled by 1/sqrt(2)), so the inner product of two entries is the mean of the
+    baseline and new cosine similarities. That mean is only used to find candidates:
+    a hit requires both similarities to reach the threshold, since versions compared
+    against the same baseline would otherwise match on the baseline alone.
+    Entries live in a flat FAISS index and are persisted per namespace under cache_dir.
+    """
+
+    def __init__(self, namespace, embedding_provider="offline", cache_dir=SEMCACHE_DIR, threshold=SIMILARITY_THRESHOLD):
+        self.embedding_provider = embedding_provider
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        os.makedirs(cache_dir, exist_ok=True)
+        name = hashlib.sha256(namespace.encode()).hexdigest()[:16]
+        self._index_path = os.path.join(cache_dir, f"{name}.faiss")
+        self._summaries_path = os.path.join(cache_dir, f"{name}.json")
+
+        self._index = None
+        self._summaries = []
+        if os.path.exists(self._index_path) and os.path.exists(self._summaries_path):
+            index = faiss.read_index(self._index_path)
+            with open(self._summaries_path, "rb") as f:
+                summaries = orjson.loads(f.read())
+            # A half-written pair of files is ignored rather than trusted
+            if index.ntotal == len(summaries):
+                self._index, self._summaries = index, summaries
+
+    def _embed(self, baseline_response, new_response):
+        vectors = np.asarray(
+            get_embeddings(self.embedding_provider).embed_documents([baseline_response, new_response]),
+            dtype="float32"
+        )
+        faiss.normalize_L2(vectors)
+        return vectors.reshape(1, -1) / np.float32(np.sqrt(2))
+
+    def lookup(self, baseline_response, new_response):
+        """
+        Returns (summary, vector). summary is None on a miss; pass vector to add()
+        once the summary has been generated.
+        """
+        vector = self._embed(baseline_response, new_response)
+        half = vector.shape[1] // 2
+        with self._lock:
+            if self._index is None or not self._index.ntotal:
+                return None, vector
+            # min(a, b) >= t implies mean(a, b) >= t, so every possible hit is in this range
+            _, _, ids = self._index.range_search(vector, self.threshold - 1e-6)
+            best, best_sim = None, self.threshold
+            for i in ids:
+                stored = self._index.reconstruct(int(i))
+                # Each half is a unit vector scaled by 1/sqrt(2), so its dot product is cos / 2
+                sim = 2 * min(float(stored[:half] @ vector[0, :half]), float(stored[half:] @ vector[0, half:]))
+                if sim >= best_sim:
+                    best, best_sim = self._summaries[int(i)], sim
+        return best, vector
+
+    def add(self, vector, summary):
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[1])
+            self._index.add(vector)
+            self._summaries.append(summary)
+            self._dirty = True
+
+    def save(self):
+        """Writes new entries to disk (temp file + rename, so readers never see a partial file)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            faiss.write_index(self._index, self._index_path + ".tmp")
+            with open(self._summaries_path + ".tmp", "wb") as f:
+                f.write(orjson.dumps(self._summaries))
+            os.replace(self._index_path + ".tmp", self._index_path)
+            os.replace(self._summaries_path + ".tmp", self._summaries_path)
+            self._dirty = False